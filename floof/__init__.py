@@ -1,2 +1,3 @@
-from ._floof import Floof
+from ._floof import Floof, Diagnostic
+from ._machine import FloofMachine
 from ._exceptions import *
\ No newline at end of file
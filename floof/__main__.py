@@ -1,18 +1,84 @@
-from ._floof import Floof
+from ._floof import Floof, Diagnostic
+from ._machine import FloofMachine
 from ._exceptions import *
+from dataclasses import asdict
+from typing import List
 import argparse
+import json
+import signal
+import sys
+
+def _run_machine(machine:FloofMachine, snapshot:str, every:int):
+
+    """Runs machine, saving its state to `snapshot` every `every` steps and on interrupt"""
+
+    # A KeyboardInterrupt could land in the middle of a step, leaving
+    # the machine half updated. Only note the interrupt and let the
+    # machine stop in between steps before saving.
+    interrupted = []
+    def on_interrupt(signum, frame):
+        interrupted.append(signum)
+        machine.interrupt()
+
+    previous = signal.signal(signal.SIGINT, on_interrupt)
+    try:
+        while not machine.run(every) and not interrupted:
+            sys.stdout.flush()
+            machine.save(snapshot)
+    finally:
+        signal.signal(signal.SIGINT, previous)
+
+    sys.stdout.flush()
+    machine.save(snapshot)
+    if interrupted:
+        print("\nInterrupted. State saved to `%s`, resume with `-r %s`"%(snapshot, snapshot))
+
+def _print_diagnostics(diagnostics:List[Diagnostic], as_json:bool):
+
+    """Prints diagnostics, as a JSON list if `as_json`"""
+
+    if as_json:
+        print(json.dumps([asdict(d) for d in diagnostics], indent=2))
+        return
+
+    for d in diagnostics:
+        loc = "??" if d.line == -1 else str(d.line)
+        if d.col != -1:
+            loc += ":%d"%d.col
+        print("[%s] Line %s: %s"%(d.severity.upper(), loc, d.msg))
 
 def main():
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("-f", "--file", required=True, type=str, help="filename to run")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("-f", "--file", type=str, help="filename to run")
+    source.add_argument("-r", "--resume", type=str, help="snapshot file to resume from")
     parser.add_argument("-v", "--verbose", type=bool, help="print intermediate steps in compilation")
+    parser.add_argument("-s", "--snapshot", type=str, help="save program state to this file periodically and on interrupt")
+    parser.add_argument("--every", type=int, default=1000000, help="steps between snapshots (default 1000000)")
+    parser.add_argument("-c", "--check", action="store_true", help="report all syntax errors and warnings without running")
+    parser.add_argument("--json", action="store_true", help="with --check, print diagnostics as JSON")
     args = parser.parse_args()
+    if args.every < 1:
+        parser.error("argument --every: must be at least 1")
     filename = args.file
     verbose = args.verbose
-    code = open(filename).read()
 
     try:
+        if args.resume:
+            machine = FloofMachine.load(args.resume)
+            _run_machine(machine, args.snapshot or args.resume, args.every)
+            return
+
+        code = open(filename).read()
+
+        if args.check:
+            diagnostics = Floof.diagnose(code)
+            _print_diagnostics(diagnostics, args.json)
+            if any(d.severity == 'error' for d in diagnostics):
+                sys.exit(1)
+            return
+
         floof = Floof(code)
         if verbose:
             print("FLOOF MIN:")
@@ -21,9 +87,13 @@ def main():
             print("PYTHON:")
             print(floof.to_code(target='python'))
             print()
-        floof.run()
-        
+
+        if args.snapshot:
+            _run_machine(floof.machine(), args.snapshot, args.every)
+        else:
+            floof.run()
+
     except (FloofParseError, FloofCompileError, FloofSyntaxError, FloofRuntimeError) as e:
         print(e)
 
-main()
\ No newline at end of file
+main()
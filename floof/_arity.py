@@ -0,0 +1,407 @@
+from typing import Dict, List, NoReturn, Optional, Set, Tuple, Union
+
+from ._exceptions import *
+from ._floof import ATOMS, FloofBlock, Node, NodeType, Token
+
+# Every curried function `[a:[b:...]]` allocates a new closure for each
+# partial application. When a function bound by `[name:body](value)` (which
+# is also how macros are bound) is applied to N arguments somewhere in
+# `body`, `value` is compiled as an N-ary python worker, and `name` is bound
+# to a curried wrapper around it. Calls with at least N arguments call the
+# worker directly, every other use of `name` goes through the wrapper:
+#
+#   [ADD:...ADD(x)(y)...b(ADD)...]([a:[b:...]])
+#   (lambda _w0: (lambda ADD: ..._w0(x, y)...b(ADD)...)(
+#       (lambda a: lambda b: _w0(a, b))))((lambda a, b: ...))
+#
+# The first N-1 levels of `value` are plain function declarations, so
+# partially applying them has no side effects and evaluating all N
+# arguments before the call does not change the program's output.
+#
+# Loops written with the Z combinator, `ZCOM([f:[a:[b:...]]])`, get a
+# worker that calls itself directly, instead of rebuilding the loop body
+# through `g(g)` on every iteration:
+#
+#   (lambda: ((_w1 := (lambda a, b: ..._w1(x, y)...)),
+#             (f := (lambda a: lambda b: _w1(a, b))))[0])()
+
+# Ways to write the Z combinator, e.g. `ZCOM` in `examples/`
+_FIXPOINT_CODE = [
+    "[f:[g:f(g(g))]([g:f([y:g(g)(y)])])]",
+    "[f:[x:f([y:x(x)(y)])]([x:f([y:x(x)(y)])])]"
+]
+
+def _spine(node:Union[Node, Token]) -> Tuple[Union[Node, Token], List[Union[Node, Token]]]:
+
+    """Unwinds nested calls `f(a)(b)...` into `f` and `[a, b, ...]`"""
+
+    args = []
+    while type(node) is not Token and node.type == NodeType.CALL:
+        node, arg = node.childs
+        args.append(arg)
+    return node, args[::-1]
+
+def _params(node:Union[Node, Token]) -> List[str]:
+
+    """Argument names of the nested function declarations at the top of `node`
+
+    Stops at the first repeated name, since python does not allow
+    `lambda x, x: ...`
+    """
+
+    params = []
+    while type(node) is not Token and node.type == NodeType.DECL:
+        argname, node = node.childs
+        if str(argname) in params:
+            break
+        params.append(str(argname))
+    return params
+
+def _strip(node:Node, n:int) -> Union[Node, Token]:
+
+    """Definition inside the first `n` nested function declarations of `node`"""
+
+    for _ in range(n):
+        node = node.childs[1]
+    return node
+
+def _n_args(args:List[Union[Node, Token]]) -> int:
+
+    """Number of arguments before the first empty one, `f(a)()` is applied to 1"""
+
+    n = 0
+    for arg in args:
+        if type(arg) is not Token and arg.type == NodeType.NONE:
+            break
+        n += 1
+    return n
+
+def _nameless(ast:Union[Node, Token], scope:List[str]) -> str:
+
+    """Ast with bound names replaced by their de Bruijn index
+
+    Two asts that only differ by the names of their arguments give the
+    same string.
+    """
+
+    if type(ast) is Token:
+        name = str(ast)
+        if name in scope:
+            return "#%d"%scope[::-1].index(name)
+        return name
+
+    if ast.type == NodeType.NONE:
+        return ""
+
+    if ast.type == NodeType.DECL:
+        argname, defi = ast.childs
+        return "[%s]"%_nameless(defi, scope+[str(argname)])
+
+    if ast.type == NodeType.CALL:
+        f, arg = ast.childs
+        return "%s(%s)"%(_nameless(f, scope), _nameless(arg, scope))
+
+    raise FloofCompileError("Unknown NodeType!")
+
+_FIXPOINTS = [_nameless(FloofBlock(code, -1, ATOMS[:]).get_ast(), []) for code in _FIXPOINT_CODE]
+
+def _is_fixpoint(ast:Union[Node, Token]) -> bool:
+
+    """True if `ast` is one of the ways to write the Z combinator"""
+
+    # Every form is `[f:A(B)]`, check that before comparing whole asts
+    if type(ast) is Token or ast.type != NodeType.DECL:
+        return False
+    defi = ast.childs[1]
+    if type(defi) is Token or defi.type != NodeType.CALL:
+        return False
+    return _nameless(ast, []) in _FIXPOINTS
+
+def _applied(ast:Union[Node, Token], scope:Dict[str, int], uses:Dict[int, int], names:Set[str]) -> NoReturn:
+
+    """Maximum number of arguments the argument of each function declaration is applied to
+
+    A name used without being called, e.g. passed as an argument, is
+    applied to 0 arguments.
+
+    Parameters
+    ----------
+    ast : Union[Node, Token]
+        Ast to search
+    scope : Dict[str, int]
+        Names in scope, and `id` of the function declaration that binds them
+    uses : Dict[int, int]
+        Results, keyed by `id` of the function declaration, filled in place.
+        Declarations whose argument is never used are left out
+    names : Set[str]
+        Every name in `ast` is added to it
+    """
+
+    if type(ast) is Token:
+        names.add(str(ast))
+        decl = scope.get(str(ast))
+        if decl is not None:
+            uses.setdefault(decl, 0)
+        return
+
+    if ast.type == NodeType.NONE:
+        return
+
+    if ast.type == NodeType.DECL:
+        argname, defi = ast.childs
+        argname = str(argname)
+        names.add(argname)
+        shadowed = scope.get(argname)
+        scope[argname] = id(ast)
+        _applied(defi, scope, uses, names)
+        if shadowed is None:
+            del scope[argname]
+        else:
+            scope[argname] = shadowed
+        return
+
+    if ast.type == NodeType.CALL:
+        head, args = _spine(ast)
+        if type(head) is Token:
+            names.add(str(head))
+            decl = scope.get(str(head))
+            if decl is not None:
+                uses[decl] = max(uses.get(decl, 0), _n_args(args))
+        else:
+            _applied(head, scope, uses, names)
+        for arg in args:
+            _applied(arg, scope, uses, names)
+        return
+
+    raise FloofCompileError("Unknown NodeType!")
+
+def _shadow(workers:Dict[str, Tuple[str, int]], fixpoints:Set[str],
+        names:List[str]) -> Tuple[Dict[str, Tuple[str, int]], Set[str]]:
+
+    """`workers` and `fixpoints` without `names`, only copied if `names` shadow one of them"""
+
+    if any(name in workers for name in names):
+        workers = {k:v for k,v in workers.items() if k not in names}
+    if any(name in fixpoints for name in names):
+        fixpoints = fixpoints - set(names)
+    return workers, fixpoints
+
+def _wrapper(worker:str, params:List[str]) -> str:
+
+    """Curried python function that calls N-ary `worker` once all `params` are given"""
+
+    return "(lambda %s: %s(%s))"%(": lambda ".join(params), worker, ", ".join(params))
+
+class _Compiler:
+
+    """
+    Class used to compile an ast into python with N-ary workers
+
+    ...
+
+    Attributes
+    ----------
+    uses : Dict[int, int]
+        Results of `_applied` for every function declaration
+    names : Set[str]
+        Names used in the program, generated names avoid them
+    count : int
+        Number of names generated so far
+
+    Methods
+    -------
+    compile(self, ast:Union[Node, Token], workers:Dict[str, Tuple[str, int]], fixpoints:Set[str]) -> str
+        Compiles ast into python
+    """
+
+    def __init__(self, ast:Union[Node, Token]):
+
+        """
+        Parameters
+        ----------
+        ast : Union[Node, Token]
+            Ast of the whole program
+        """
+
+        self.uses = {}
+        self.names = set()
+        _applied(ast, {}, self.uses, self.names)
+        self.count = 0
+
+    def _fresh(self) -> str:
+
+        """Name of a new worker"""
+
+        while True:
+            name = "_w%d"%self.count
+            self.count += 1
+            if name not in self.names:
+                return name
+
+    def _fixpoint(self, head:Union[Node, Token], args:List[Union[Node, Token]],
+            fixpoints:Set[str]) -> Optional[Tuple[str, List[str]]]:
+
+        """Recursion variable and arguments of a loop `ZCOM([f:[a:[b:...]]])`, None if not a loop"""
+
+        if type(head) is not Token or str(head) not in fixpoints or not _n_args(args):
+            return None
+        loop = args[0]
+        if type(loop) is Token or loop.type != NodeType.DECL:
+            return None
+        params = _params(loop)
+        if len(params) < 2:
+            return None
+        return params[0], params[1:]
+
+    def _loop(self, loop:Node, worker:str, workers:Dict[str, Tuple[str, int]],
+            fixpoints:Set[str], result:int) -> str:
+
+        """Compiles loop body `[f:[a:[b:...]]]` of `ZCOM` into a worker that calls itself
+
+        The expression evaluates to the worker if `result` is 0, or to
+        its curried wrapper, which is also bound to `f`, if `result` is 1.
+        """
+
+        params = _params(loop)
+        f, params = params[0], params[1:]
+        n_workers, n_fixpoints = _shadow(workers, fixpoints, params+[f])
+        n_workers = dict(n_workers)
+        n_workers[f] = (worker, len(params))
+        defi = self.compile(_strip(loop, len(params)+1), n_workers, n_fixpoints)
+        return "(lambda: ((%s := (lambda %s: %s)), (%s := %s))[%d])()"%(
+            worker, ", ".join(params), defi, f, _wrapper(worker, params), result)
+
+    def _bind(self, head:Node, args:List[Union[Node, Token]], workers:Dict[str, Tuple[str, int]],
+            fixpoints:Set[str]) -> str:
+
+        """Compiles bindings `[x1:[x2:body]](v1)(v2)` as `(lambda x1, x2: body)(v1, v2)`
+
+        Values that are functions applied to N arguments in `body` get
+        an N-ary worker, see the top of this file.
+        """
+
+        names = _params(head)[:_n_args(args)]
+        body = _strip(head, len(names))
+
+        new_workers = []
+        values = []
+        n_workers, n_fixpoints = _shadow(workers, fixpoints, names)
+        n_workers, n_fixpoints = dict(n_workers), set(n_fixpoints)
+        for idx, (name, value) in enumerate(zip(names, args)):
+            uses = self.uses.get(id(_strip(head, idx)), 0)
+            params = _params(value)
+            n = min(len(params), uses)
+            loop = None if type(value) is Token else self._fixpoint(*_spine(value), fixpoints)
+
+            if type(value) is Token and str(value) in workers:
+                n_workers[name] = workers[str(value)]
+                values.append(str(value))
+
+            elif type(value) is Token and str(value) in fixpoints or _is_fixpoint(value):
+                n_fixpoints.add(name)
+                values.append(self.compile(value, workers, fixpoints))
+
+            elif loop and len(_spine(value)[1]) == 1:
+                worker = self._fresh()
+                new_workers.append((worker, self._loop(_spine(value)[1][0], worker, workers, fixpoints, 0)))
+                n_workers[name] = (worker, len(loop[1]))
+                values.append(_wrapper(worker, loop[1]))
+
+            elif n >= 2:
+                worker = self._fresh()
+                defi = self.compile(_strip(value, n), *_shadow(workers, fixpoints, params[:n]))
+                new_workers.append((worker, "(lambda %s: %s)"%(", ".join(params[:n]), defi)))
+                n_workers[name] = (worker, n)
+                values.append(_wrapper(worker, params[:n]))
+
+            else:
+                values.append(self.compile(value, workers, fixpoints))
+
+        code = "(lambda %s: %s)(%s)"%(", ".join(names), self.compile(body, n_workers, n_fixpoints), ", ".join(values))
+        if new_workers:
+            # Workers only declare functions, so evaluating them before
+            # the values does not change the program's output
+            code = "(lambda %s: %s)(%s)"%(
+                ", ".join(w for w,_ in new_workers), code, ", ".join(c for _,c in new_workers))
+        return code
+
+    def compile(self, ast:Union[Node, Token], workers:Dict[str, Tuple[str, int]], fixpoints:Set[str]) -> str:
+
+        """Compiles ast into python
+
+        Parameters
+        ----------
+        ast : Union[Node, Token]
+            Ast to compile
+        workers : Dict[str, Tuple[str, int]]
+            Names in scope that have an N-ary worker, with the worker's name and N
+        fixpoints : Set[str]
+            Names in scope that are bound to the Z combinator
+
+        Returns
+        -------
+        str
+            Python code
+        """
+
+        if type(ast) is Token:
+            return str(ast)
+
+        if ast.type == NodeType.NONE:
+            return ""
+
+        if ast.type == NodeType.DECL:
+            argname, defi = ast.childs
+            return "(lambda %s: %s)"%(argname, self.compile(defi, *_shadow(workers, fixpoints, [str(argname)])))
+
+        if ast.type != NodeType.CALL:
+            raise FloofCompileError("Unknown NodeType!")
+
+        head, args = _spine(ast)
+        n_args = _n_args(args)
+        loop = self._fixpoint(head, args, fixpoints)
+
+        if type(head) is Token and str(head) in workers and n_args >= workers[str(head)][1]:
+            worker, n = workers[str(head)]
+            code = "%s(%s)"%(worker, ", ".join(self.compile(a, workers, fixpoints) for a in args[:n]))
+            args = args[n:]
+
+        elif loop:
+            _, params = loop
+            worker = self._fresh()
+            if n_args > len(params):
+                code = "%s(%s)"%(self._loop(args[0], worker, workers, fixpoints, 0),
+                    ", ".join(self.compile(a, workers, fixpoints) for a in args[1:len(params)+1]))
+                args = args[len(params)+1:]
+            else:
+                code = self._loop(args[0], worker, workers, fixpoints, 1)
+                args = args[1:]
+
+        elif type(head) is not Token and head.type == NodeType.DECL and n_args:
+            code = self._bind(head, args, workers, fixpoints)
+            args = args[len(_params(head)[:n_args]):]
+
+        else:
+            code = self.compile(head, workers, fixpoints)
+
+        for arg in args:
+            code += "(%s)"%self.compile(arg, workers, fixpoints)
+
+        return code
+
+def to_python(ast:Union[Node, Token]) -> str:
+
+    """Compiles ast into python, calling functions with N arguments at once where possible
+
+    Parameters
+    ----------
+    ast : Union[Node, Token]
+        Ast of the whole program
+
+    Returns
+    -------
+    str
+        Python code
+    """
+
+    return _Compiler(ast).compile(ast, {}, set())
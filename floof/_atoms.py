@@ -5,6 +5,14 @@ _N2 = lambda f: lambda x: f(f(x))
 _INC = lambda n: lambda f: lambda x: f(n(f)(x))
 _ADD = lambda a: lambda b: b(_INC)(a)
 
+# Binary numerals are arrays of bits, least significant bit first.
+# Arrays are (BOOL, (ELEMENT, NEXT)) where BOOL is TRUE at the end
+# of the array, like in `examples/`.
+_TRUE = lambda x: lambda y: x
+_FALSE = lambda x: lambda y: y
+_PAIR = lambda x: lambda y: lambda f: f(x)(y)
+_BIN_EMPTY = _PAIR(_TRUE)(_TRUE)
+
 def _in_int(n:int):
     if n in [0,1]:
         return [_N0, _N1][n]
@@ -13,9 +21,14 @@ def _in_int(n:int):
     n_f = _in_int(n//2)
     return _ADD(n_f)(n_f)
 
-def IN_INT():
+def _read_int() -> int:
     n = int(input())
-    return _in_int(n)
+    if n < 0:
+        raise ValueError("Input `%d` is not a non-negative integer"%n)
+    return n
+
+def IN_INT():
+    return _in_int(_read_int())
 
 _buffer = ""
 def IN_CHAR():
@@ -32,4 +45,34 @@ def OUT_INT(arg):
 
 def OUT_CHAR(arg):
     print(chr(arg(lambda n:n+1)(0)), end="")
-    return arg
\ No newline at end of file
+    return arg
+
+def _in_bin(n:int):
+    arr = _BIN_EMPTY
+    for bit in bin(n)[2:]:
+        arr = _PAIR(_FALSE)(_PAIR(_TRUE if bit == '1' else _FALSE)(arr))
+    return arr
+
+def _to_bool(arg) -> bool:
+    b = arg(True)(False)
+    if type(b) is not bool:
+        raise ValueError("`_OUT_BIN_` called with an object that is not a binary numeral")
+    return b
+
+def _out_bin(arg) -> int:
+    n = 0
+    bit = 1
+    while not _to_bool(arg(_TRUE)):
+        cell = arg(_FALSE)
+        if _to_bool(cell(_TRUE)):
+            n |= bit
+        bit <<= 1
+        arg = cell(_FALSE)
+    return n
+
+def IN_BIN():
+    return _in_bin(_read_int())
+
+def OUT_BIN(arg):
+    print(_out_bin(arg), end="")
+    return arg
@@ -2,7 +2,7 @@ class FloofSyntaxError(Exception):
 
     """Exception raised for syntax errors in Floof program"""
 
-    def __init__(self, line:int, msg:str):
+    def __init__(self, line:int, msg:str, col:int=-1, end_col:int=-1):
 
         """
         Parameters
@@ -11,8 +11,17 @@ class FloofSyntaxError(Exception):
             Line number of error
         msg : str
             Explanation of error
+        col : int, optional (default -1)
+            Column number where the error starts, -1 if unknown
+        end_col : int, optional (default -1)
+            Column number after the end of the error, -1 if unknown
         """
 
+        self.line = line
+        self.msg = msg
+        self.col = col
+        self.end_col = end_col
+
         line_str = "??" if line==-1 else str(line)
         super().__init__("Syntax error! Line %s: %s"%(line_str, msg))
 
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import List, Literal, Union, Tuple, NoReturn
+from typing import Callable, List, Literal, Union, Tuple, NoReturn, Optional
 from enum import Enum, unique
 import re
 
@@ -26,10 +26,34 @@ class Token:
     obj_str: str
     line: int
     is_name: bool
+    col: int = -1
 
     def __str__(self):
         return self.obj_str
 
+    def span(self) -> Tuple[int, int]:
+
+        """Columns at which the token starts and ends (exclusive), -1 if unknown"""
+
+        if self.col == -1:
+            return -1, -1
+        return self.col, self.col+len(self.obj_str)
+
+@dataclass
+class Diagnostic:
+
+    """Error or warning found while parsing, see `Floof.diagnose`"""
+
+    severity: Literal['error', 'warning']
+    msg: str
+    line: int
+    col: int = -1
+    end_col: int = -1
+
+    @classmethod
+    def from_error(cls, e:FloofSyntaxError) -> 'Diagnostic':
+        return cls('error', e.msg, e.line, e.col, e.end_col)
+
 @dataclass
 class Node:
     type: NodeType
@@ -79,7 +103,9 @@ ATOMS = [
     Token('_OUT_CHAR_', -1, True),
     Token('_IN_CHAR_', -1, True),
     Token('_OUT_INT_', -1, True),
-    Token('_IN_INT_', -1, True)
+    Token('_IN_INT_', -1, True),
+    Token('_OUT_BIN_', -1, True),
+    Token('_IN_BIN_', -1, True)
 ]
 
 class FloofBlock:
@@ -108,14 +134,15 @@ class FloofBlock:
     from_ast(self, ast: Node) -> `FloofBlock`
         Initialises FloofBlock directly from AST
 
-    to_code(self, target:Literal['floof', 'python'] = 'python') -> str
+    to_code(self, target:Literal['floof', 'python'] = 'python', optimise:bool=False) -> str
         Compiles FloofBlock into `target` ("floof" or "python")
 
     get_ast(self) -> Node
         Returns self._ast
     """
 
-    def __init__(self, code:str, line:int, namespace:List[Token], _from_ast=False) -> NoReturn:
+    def __init__(self, code:str, line:int, namespace:List[Token], _from_ast=False,
+            errors:Optional[List[FloofSyntaxError]]=None) -> NoReturn:
 
         """
         Parameters
@@ -126,6 +153,9 @@ class FloofBlock:
             Line number where the block was from
         namespace : List[Token]
             Contains all tokens that block can reference
+        errors : Optional[List[FloofSyntaxError]], optional (default None)
+            If given, invalid and undefined names are appended to `errors`
+            instead of raised, and parsing continues past them
         """
 
         if _from_ast:
@@ -136,8 +166,8 @@ class FloofBlock:
         self.line = line
         self.namespace = namespace
 
-        self._tokens = self._tokenize()
-        self._ast = self._tokens_to_ast(self._tokens, self.namespace)
+        self._tokens = self._tokenize(errors)
+        self._ast = self._tokens_to_ast(self._tokens, self.namespace, errors)
 
     @classmethod
     def from_ast(cls, ast:Node) -> 'FloofBlock':
@@ -156,10 +186,15 @@ class FloofBlock:
         """
         return cls("", 0, [], _from_ast=ast)
 
-    def _tokenize(self) -> List[Token]:
+    def _tokenize(self, errors:Optional[List[FloofSyntaxError]]=None) -> List[Token]:
 
         """Tokenizes self.code
 
+        Parameters
+        ----------
+        errors : Optional[List[FloofSyntaxError]], optional (default None)
+            If given, invalid names are appended to `errors` and skipped
+
         Returns
         -------
         List[Token]
@@ -170,6 +205,7 @@ class FloofBlock:
         line = self.line
         code = self.code
         idx = 0
+        line_start = 0
 
         while True:
 
@@ -177,30 +213,41 @@ class FloofBlock:
                 break
 
             c = code[idx]
+            col = idx-line_start+1
 
             # Ignore whitespaces
             if re.match(r'^\s$', c):
-                if c == '\n': line += 1
+                if c == '\n':
+                    line += 1
+                    line_start = idx+1
 
             elif c in '[]():':
                 tokens.append(
                     Token(
                         obj_str = c,
                         line = line,
-                        is_name = False
+                        is_name = False,
+                        col = col
                     ))
 
             else:
                 match = re.match("^"+VALID_NAME_REGEX, code[idx:])
                 if not match:
                     code_snippet = code[idx:min(len(code)-1, idx+10)]
-                    raise FloofSyntaxError(line, "Invalid name `%s...`!"%code_snippet)
+                    bad = re.match(r"[^\s\[\]():]+", code[idx:]).group()
+                    e = FloofSyntaxError(line, "Invalid name `%s...`!"%code_snippet, col, col+len(bad))
+                    if errors is None:
+                        raise e
+                    errors.append(e)
+                    idx += len(bad)
+                    continue
                 obj_str = match.group()
                 tokens.append(
                     Token(
                         obj_str = obj_str,
                         line = line,
-                        is_name = True
+                        is_name = True,
+                        col = col
                     ))
                 idx += len(obj_str)
                 continue
@@ -231,9 +278,6 @@ class FloofBlock:
         if start_bracket not in '[(':
             raise FloofParseError("`get_bracket_pair` called with `%c` when looking for one of either `(` or `[`!"%start_bracket)
 
-        if len(tokens[start_idx:]) <= 1:
-            return None
-
         end_bracket = {
             "(":")",
             "[":"]"
@@ -251,11 +295,11 @@ class FloofBlock:
                 depth -= 1
 
         t = tokens[start_idx]
-        raise FloofSyntaxError(t.line, "Unbalanced bracket `%s`."%t)
-        #return None
+        raise FloofSyntaxError(t.line, "Unbalanced bracket `%s`."%t, *t.span())
 
     @staticmethod
-    def _tokens_to_ast(tokens:List[Token], namespace:List[Token]) -> Node:
+    def _tokens_to_ast(tokens:List[Token], namespace:List[Token],
+            errors:Optional[List[FloofSyntaxError]]=None) -> Node:
 
         """Converts tokens to Node
         
@@ -265,6 +309,8 @@ class FloofBlock:
             Tokens to parse to ast
         namespace : List[Token]
             Namespace at which the tokens are in
+        errors : Optional[List[FloofSyntaxError]], optional (default None)
+            If given, undefined names are appended to `errors` instead of raised
 
         Returns
         -------
@@ -281,20 +327,23 @@ class FloofBlock:
         if t0.is_name:
 
             if str(t0) not in ns_str:
-                raise FloofSyntaxError(t0.line, "Name `%s` is not defined!"%t0)
+                e = FloofSyntaxError(t0.line, "Name `%s` is not defined!"%t0, *t0.span())
+                if errors is None:
+                    raise e
+                errors.append(e)
 
             if len(tokens) == 1:
                 return t0
 
             t1 = tokens[1]
             if str(t1) != "(":
-                raise FloofSyntaxError(t1.line, "Unexpected token `%s`. Expected `(`."%t1)
+                raise FloofSyntaxError(t1.line, "Unexpected token `%s`. Expected `(`."%t1, *t1.span())
 
             end_idx = FloofBlock._get_bracket_pair(tokens, 1)
             n_tokens = tokens[2:end_idx]
 
             node = Node(NodeType.CALL, (
-                t0, FloofBlock._tokens_to_ast(n_tokens, namespace)
+                t0, FloofBlock._tokens_to_ast(n_tokens, namespace, errors)
             ))
 
         elif str(t0) == '(':
@@ -302,46 +351,46 @@ class FloofBlock:
             end_idx = FloofBlock._get_bracket_pair(tokens, 0)
             n_tokens = tokens[1:end_idx]
 
-            node = FloofBlock._tokens_to_ast(n_tokens, namespace)
+            node = FloofBlock._tokens_to_ast(n_tokens, namespace, errors)
 
         elif str(t0) == '[':
 
             if len(tokens) < 5:
-                raise FloofSyntaxError(t0.line, "Incomplete function declaration!")
+                raise FloofSyntaxError(t0.line, "Incomplete function declaration!", *t0.span())
 
             t1 = tokens[1]
             if not t1.is_name:
-                raise FloofSyntaxError(t1.line, "Unexpected token `%s`. Expected a name"%t1)
+                raise FloofSyntaxError(t1.line, "Unexpected token `%s`. Expected a name"%t1, *t1.span())
             
             t2 = tokens[2]
             if str(t2) != ':':
-                raise FloofSyntaxError(t2.line, "Unexpected token `%s`. Expected `:` instead"%t2)
+                raise FloofSyntaxError(t2.line, "Unexpected token `%s`. Expected `:` instead"%t2, *t2.span())
 
             end_idx = FloofBlock._get_bracket_pair(tokens, 0)
             n_tokens = tokens[3:end_idx]
             n_namespace = namespace[:] + [t1]
 
             node = Node(NodeType.DECL, (
-                t1, FloofBlock._tokens_to_ast(n_tokens, n_namespace)
+                t1, FloofBlock._tokens_to_ast(n_tokens, n_namespace, errors)
             ))
 
         else:
-            raise FloofSyntaxError(t0.line, "Unexpected token `%s`. Expected `(`, `[` or a name"%t0)
+            raise FloofSyntaxError(t0.line, "Unexpected token `%s`. Expected `(`, `[` or a name"%t0, *t0.span())
 
         while end_idx != len(tokens)-1:
             tmp = end_idx
             t = tokens[tmp+1]
             if str(t) != '(':
-                raise FloofSyntaxError(t.line, "Unexpected token `%s`. Expected `(` instead"%t)
+                raise FloofSyntaxError(t.line, "Unexpected token `%s`. Expected `(` instead"%t, *t.span())
             end_idx = FloofBlock._get_bracket_pair(tokens, tmp+1)
             n_tokens = tokens[tmp+2: end_idx]
             node = Node(NodeType.CALL, (
-                node, FloofBlock._tokens_to_ast(n_tokens, namespace)
+                node, FloofBlock._tokens_to_ast(n_tokens, namespace, errors)
             ))
 
         return node
 
-    def to_code(self, target:Literal['floof', 'python'] = 'python') -> str:
+    def to_code(self, target:Literal['floof', 'python'] = 'python', optimise:bool=False) -> str:
 
         """Compiles Floof program into `target` ("floof" or "python")
 
@@ -349,6 +398,10 @@ class FloofBlock:
         ----------
         target : Literal['floof', 'python'], optional (default 'python')
             Target to compile to
+        optimise : bool, optional (default False)
+            If target is "python", calls functions that are applied to N
+            arguments, and loops written with the Z combinator, through
+            N-ary python functions
 
         Returns
         -------
@@ -356,6 +409,10 @@ class FloofBlock:
             String representing code of `target`
         """
 
+        if optimise and target == 'python':
+            from ._arity import to_python
+            return to_python(self._ast)
+
         return self._ast.to_str(target=target)
 
     def get_ast(self) -> Node:
@@ -388,10 +445,14 @@ class Floof:
 
     Methods
     -------
-    to_code(self, target:Literal['floof', 'python'] = 'python') -> str
+    to_code(self, target:Literal['floof', 'python'] = 'python', optimise:bool=False) -> str
         Compiles Floof program into `target` ("floof" or "python")
-    run(self) -> NoReturn
+    run(self, optimise:bool=True) -> Callable
         Runs floof program
+    diagnose(code:str) -> List[Diagnostic]
+        Collects all syntax errors and warnings of a Floof program in one pass
+    machine(self) -> `FloofMachine`
+        Returns a FloofMachine that evaluates floof program step by step
     """
 
     def __init__(self, code:str) -> NoReturn:
@@ -407,7 +468,8 @@ class Floof:
         self._mainblock = self._to_FloofBlock(code)
 
     @staticmethod
-    def _parse_macro(lines:List[str], line_idx:int, namespace:List[Token]) -> Tuple[Token, FloofBlock, int]:
+    def _parse_macro(lines:List[str], line_idx:int, namespace:List[Token],
+            errors:Optional[List[FloofSyntaxError]]=None) -> Tuple[Token, FloofBlock, int]:
 
         """Parses macro
 
@@ -420,6 +482,8 @@ class Floof:
             line index at which this macro is in the original Floof program
         namespace : List[Token]
             Contains all tokens that this macro can reference
+        errors : Optional[List[FloofSyntaxError]], optional (default None)
+            Passed to FloofBlock, see `FloofBlock.__init__`
 
         Returns
         -------
@@ -430,8 +494,10 @@ class Floof:
         """
 
         idx = line_idx
+        span = (1, len(lines[idx].rstrip())+1)
         macro_name = lines[idx][1:].strip()
         macro_def = ""
+        l = ""
         for j,l in enumerate(lines[idx+1:]):
             if not l:
                 macro_def += l+"\n"
@@ -439,31 +505,32 @@ class Floof:
             if l[0]=='~':
                 break
             if l[0]=='!':
-                raise FloofSyntaxError(idx+1, "Main definition within macro not allowed")
+                raise FloofSyntaxError(idx+1, "Main definition within macro not allowed", *span)
             macro_def += l+"\n"
 
         if not macro_name:
-            raise FloofSyntaxError(idx+1, "No name given to macro")
+            raise FloofSyntaxError(idx+1, "No name given to macro", *span)
 
         if not re.match("^%s$"%VALID_NAME_REGEX, macro_name):
-            raise FloofSyntaxError(idx+1, "Macro name `%s` invalid"%macro_name)
+            raise FloofSyntaxError(idx+1, "Macro name `%s` invalid"%macro_name, *span)
 
         if not l or l[0] != '~':
-            raise FloofSyntaxError(idx+1, "Macro `%s` terminator not found"%macro_name)
+            raise FloofSyntaxError(idx+1, "Macro `%s` terminator not found"%macro_name, *span)
 
-        macro_name = Token(macro_name, line_idx+1, True)
-        macro_block = FloofBlock(macro_def, line_idx+2, namespace)
+        macro_name = Token(macro_name, line_idx+1, True, lines[idx].index(macro_name)+1)
+        macro_block = FloofBlock(macro_def, line_idx+2, namespace, errors=errors)
         ast = macro_block.get_ast()
         
         if type(ast) != Token and ast.type == NodeType.NONE:
-            raise FloofSyntaxError(idx+1, "Macro `%s` is empty"%macro_name)
+            raise FloofSyntaxError(idx+1, "Macro `%s` is empty"%macro_name, *span)
 
         end_line_idx = j+idx+2
 
         return macro_name, macro_block, end_line_idx
 
     @staticmethod
-    def _parse_main(lines:List[str], line_idx:int, namespace:List[Token]) -> Tuple[FloofBlock, int]:
+    def _parse_main(lines:List[str], line_idx:int, namespace:List[Token],
+            errors:Optional[List[FloofSyntaxError]]=None) -> Tuple[FloofBlock, int]:
 
         """Parses main block
 
@@ -476,6 +543,8 @@ class Floof:
             line index at which the main block is in the original Floof program
         namespace : List[Token]
             Contains all tokens that this main block can reference
+        errors : Optional[List[FloofSyntaxError]], optional (default None)
+            Passed to FloofBlock, see `FloofBlock.__init__`
 
         Returns
         -------
@@ -485,7 +554,9 @@ class Floof:
         """
 
         idx = line_idx
+        span = (1, len(lines[idx].rstrip())+1)
         main = ""
+        l = ""
         for j,l in enumerate(lines[idx+1:]):
             if not l:
                 main += "\n"
@@ -493,17 +564,17 @@ class Floof:
             if l[0]=='~':
                 break
             if l[0]=='#':
-                raise FloofSyntaxError(idx+1, "Macro definition within main not allowed")
+                raise FloofSyntaxError(idx+1, "Macro definition within main not allowed", *span)
             main += l+"\n"
 
         if not l or l[0] != '~':
-            raise FloofSyntaxError(idx+1, "Main terminator not found")
+            raise FloofSyntaxError(idx+1, "Main terminator not found", *span)
 
-        main_block = FloofBlock(main, line_idx+2, namespace)
+        main_block = FloofBlock(main, line_idx+2, namespace, errors=errors)
         ast = main_block.get_ast()
         
         if type(ast) != Token and ast.type == NodeType.NONE:
-            raise FloofSyntaxError(idx+1, "Main is empty")
+            raise FloofSyntaxError(idx+1, "Main is empty", *span)
 
         return main_block, j+idx+2
 
@@ -552,7 +623,23 @@ class Floof:
 
 
     @staticmethod
-    def _to_FloofBlock(code:str) -> FloofBlock:
+    def _warn(diagnostics:Optional[List[Diagnostic]], line:int, msg:str, col:int=-1, end_col:int=-1,
+            show_line:bool=True) -> NoReturn:
+
+        """Shows warning, or appends it to `diagnostics` if given
+
+        The shown warning is prefixed with `line` only if `show_line`
+        """
+
+        if diagnostics is None:
+            if show_line:
+                msg = "Line %d: %s"%(line, msg)
+            warnings.warn("[WARNING] %s"%msg)
+        else:
+            diagnostics.append(Diagnostic('warning', msg, line, col, end_col))
+
+    @staticmethod
+    def _to_FloofBlock(code:str, diagnostics:Optional[List[Diagnostic]]=None) -> FloofBlock:
 
         """Converts Floof program into a FloofBlock
 
@@ -560,15 +647,22 @@ class Floof:
         ----------
         code : str
             The floof program
+        diagnostics : Optional[List[Diagnostic]], optional (default None)
+            If given, syntax errors and warnings are appended to
+            `diagnostics` instead of raised and shown, and parsing
+            continues with the next block after an error
 
         Returns
         -------
         FloofBlock
-            FloofBlock that represents the floof program
+            FloofBlock that represents the floof program, None if
+            `diagnostics` is given and the program has errors
         """
 
         code = code
         lines = code.split("\n")
+        recover = diagnostics is not None
+        errors = [] if recover else None
 
         # Remove comments
         for idx,line in enumerate(lines):
@@ -577,9 +671,10 @@ class Floof:
             lines[idx] = line.split(';')[0]
 
         # Parse macro and main
-        namespace = ATOMS
+        namespace = ATOMS[:]
         macros = []
         main = None
+        found_main = False
         end_idx = 0
         for idx,line in enumerate(lines):
 
@@ -587,26 +682,51 @@ class Floof:
 
             if line[0] == '#':
 
-                name, macro, end_idx = Floof._parse_macro(lines, idx, namespace)
-                if str(name) in [str(n) for n,_ in macros]:
-                    raise FloofSyntaxError(idx+1, "Macro `%s` has been defined more than once."%name)
+                try:
+                    name, macro, end_idx = Floof._parse_macro(lines, idx, namespace, errors)
+                    if str(name) in [str(n) for n,_ in macros]:
+                        raise FloofSyntaxError(idx+1, "Macro `%s` has been defined more than once."%name, *name.span())
+                except FloofSyntaxError as e:
+                    if not recover:
+                        raise
+                    errors.append(e)
+                    # Later blocks can still reference the macro
+                    macro_name = line[1:].strip()
+                    if re.match("^%s$"%VALID_NAME_REGEX, macro_name):
+                        namespace.append(Token(macro_name, idx+1, True))
+                    continue
                 
                 macros.append((name, macro))
                 namespace.append(name)
                 continue
 
             if line[0] == '!':
-                main, end_idx = Floof._parse_main(lines, idx, namespace)
+                found_main = True
+                try:
+                    main, end_idx = Floof._parse_main(lines, idx, namespace, errors)
+                except FloofSyntaxError as e:
+                    if not recover:
+                        raise
+                    errors.append(e)
                 break
 
-        if len(lines) >= end_idx:
+        if main and len(lines) >= end_idx:
             leftovers = "\n".join(lines[end_idx:])
             if not re.match(r"^\s*$", leftovers):
-                warnings.warn("[WARNING] Code after line %d is ignored!"%end_idx)
+                Floof._warn(diagnostics, end_idx+1, "Code after line %d is ignored!"%end_idx, show_line=False)
 
         # Check if main was never found
+        if not found_main:
+            e = FloofSyntaxError(-1, "No main found")
+            if not recover:
+                raise e
+            errors.append(e)
+
+        if recover:
+            diagnostics.extend(Diagnostic.from_error(e) for e in errors)
+
         if not main:
-            raise FloofSyntaxError(-1, "No main found")
+            return None
 
         # Create AST for full program
         main_ast = main.get_ast()
@@ -615,7 +735,7 @@ class Floof:
         for name, macro in macros[::-1]:
 
             if not Floof._search_macro(main_ast, str(name), main_namespace):
-                warnings.warn("[WARNING] Line %d: Macro `%s` is not used"%(name.line, str(name)))
+                Floof._warn(diagnostics, name.line, "Macro `%s` is not used"%name, *name.span())
                 continue
 
             main_namespace = [t for t in main_namespace if str(t) != str(name)]
@@ -626,9 +746,37 @@ class Floof:
                     Node(type = NodeType.DECL, childs = (name, main_ast)), 
                     macro.get_ast()))
 
+        if errors:
+            return None
+
         return FloofBlock.from_ast(main_ast)
 
-    def to_code(self, target:Literal['floof', 'python'] = 'python') -> str:
+    @staticmethod
+    def diagnose(code:str) -> List[Diagnostic]:
+
+        """Collects all syntax errors and warnings of a Floof program in one pass
+
+        Unlike `Floof(code)`, parsing does not stop at the first error.
+        A block with an error is skipped, and parsing continues with the
+        next block. Undefined and invalid names are reported without
+        skipping the rest of their block.
+
+        Parameters
+        ----------
+        code : str
+            Floof program code
+
+        Returns
+        -------
+        List[Diagnostic]
+            Errors and warnings, ordered by line
+        """
+
+        diagnostics = []
+        Floof._to_FloofBlock(code, diagnostics)
+        return sorted(diagnostics, key=lambda d: (d.line == -1, d.line, d.col))
+
+    def to_code(self, target:Literal['floof', 'python'] = 'python', optimise:bool=False) -> str:
 
         """Compiles Floof program into `target` ("floof" or "python")
 
@@ -636,18 +784,34 @@ class Floof:
         ----------
         target : Literal['floof', 'python'], optional (default 'python')
             Target to compile to
+        optimise : bool, optional (default False)
+            If target is "python", calls functions that are applied to N
+            arguments, and loops written with the Z combinator, through
+            N-ary python functions
 
         Returns
         -------
         str
             String representing code of `target`
         """
-        code = self._mainblock.to_code(target)
+        code = self._mainblock.to_code(target, optimise)
         return code
 
-    def run(self) -> NoReturn:
+    def run(self, optimise:bool=True) -> Callable:
+
+        """Runs floof program
 
-        """Runs floof program"""
+        Parameters
+        ----------
+        optimise : bool, optional (default True)
+            Calls functions through N-ary python functions where
+            possible, see `to_code`
+
+        Returns
+        -------
+        Callable
+            Object the main block evaluates to
+        """
 
         globals_sandbox = {}
         for a in dir(_atoms):
@@ -655,6 +819,21 @@ class Floof:
                 globals_sandbox["_%s_"%a] = getattr(_atoms, a)
 
         try:
-            eval(self.to_code(), globals_sandbox, {})
+            return eval(self.to_code(optimise=optimise), globals_sandbox, {})
         except Exception as e:
             raise FloofRuntimeError(e.args[0]) from e
+
+    def machine(self) -> 'FloofMachine':
+
+        """Returns a FloofMachine that evaluates floof program step by step
+
+        Unlike `run`, the state of a FloofMachine can be saved and resumed.
+
+        Returns
+        -------
+        FloofMachine
+            Machine at the start of floof program
+        """
+
+        from ._machine import FloofMachine
+        return FloofMachine(self._mainblock.get_ast())
@@ -0,0 +1,565 @@
+"""Differential correctness and performance harness
+
+Runs every program in `examples/` and randomly generated programs through
+every backend, checking that they all print the same output, and raise the
+same type of error, as the reference backend (`Floof.run` without
+optimisations). The object each program evaluates to is decoded as an
+integer on every backend and compared too. Objects that are not integers,
+e.g. binary numerals, decode to None. Random programs also carry the output
+they are expected to print and the integer they evaluate to, or that they
+raise a runtime error.
+
+`Floof.diagnose` is checked on the programs with syntax errors in
+`DIAGNOSE_CASES`.
+
+Backends in `FAST_BACKENDS` fail if they are slower than the reference on
+an example by more than `--threshold`. Timings (and step counts, for
+backends that have them) can be saved as a baseline, later runs fail if a
+backend gets slower than the baseline by more than `--threshold`.
+
+Usage:
+    python -m floof._harness [--seed N] [--count N] [--save-baseline FILE]
+    python -m floof._harness --baseline FILE [--threshold 0.25]
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import random
+import sys
+import time
+import warnings
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from ._floof import Floof, Node, NodeType, Token
+from ._exceptions import *
+from . import _atoms
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+
+# Input given to example programs that read from stdin
+EXAMPLE_INPUT = "15\n7\n"
+
+# Examples that need a larger input to run long enough to be timed
+EXAMPLE_INPUTS = {"binary.floof": "9999\n9\n"}
+
+# Programs with syntax errors, and the (severity, message, line, col) of
+# every diagnostic `Floof.diagnose` is expected to report for them
+DIAGNOSE_CASES = [
+    # Errors in several blocks are all reported
+    ("#A\n[x:\n~\n#B\n[y:y]](\n~\n!\nA\n~\n", [
+        ('error', "Incomplete function declaration!", 2, 1),
+        ('error', "Unexpected token `]`. Expected `(` instead", 5, 6),
+    ]),
+    # A macro that failed to parse is still defined for later blocks
+    ("#A\n[x:x\n~\n!\nA(A)\n~\n", [
+        ('error', "Incomplete function declaration!", 2, 1),
+    ]),
+    ("!\n[x:x](\n~\n", [
+        ('error', "Unbalanced bracket `(`.", 2, 6),
+    ]),
+    # Program ends right after a header, without a newline
+    ("#A\n[x:x]\n~\n#B", [
+        ('error', "Macro `B` terminator not found", 4, 1),
+        ('error', "No main found", -1, -1),
+    ]),
+    ("#A\n[x:x]\n~\n!", [
+        ('error', "Main terminator not found", 4, 1),
+    ]),
+]
+
+REFERENCE = 'python'
+
+# Backends that exist to be faster than REFERENCE. `machine` trades
+# speed for a resumable state, so it is only checked against a baseline.
+FAST_BACKENDS = ['python-nary']
+
+# Slowdowns smaller than this many seconds are treated as noise
+TIME_RESOLUTION = 0.01
+
+def _run_python(floof:Floof, optimise:bool) -> Tuple[Optional[int], Callable[[], int]]:
+    value = floof.run(optimise=optimise)
+    return None, lambda: value(lambda n:n+1)(0)
+
+def _run_machine(floof:Floof) -> Tuple[Optional[int], Callable[[], int]]:
+    machine = floof.machine()
+    machine.run()
+    return machine.steps, machine.to_int
+
+# Each backend runs the program and returns its step count (None if the
+# backend does not count steps), and a function that decodes the object
+# the program evaluated to as an integer
+BACKENDS: Dict[str, Callable[[Floof], Tuple[Optional[int], Callable[[], int]]]] = {
+    'python': lambda floof: _run_python(floof, False),
+    'python-nary': lambda floof: _run_python(floof, True),
+    'machine': _run_machine
+}
+
+PRELUDE = """
+#ZCOM
+[f:[g:f(g(g))]([g:f([y:g(g)(y)])])]
+~
+#INC
+[n:[f:[x:f(n(f)(x))]]]
+~
+#ADD
+[a:[b:b(INC)(a)]]
+~
+#MUL
+[a:[b:b([y:ADD(y)(a)])([f:[x:x]])]]
+~
+#TRUE
+[x:[y:x]]
+~
+#FALSE
+[x:[y:y]]
+~
+#DEC
+[n:[f:[x:n([g:[y:y(g(f))]])([y:x])([y:y])]]]
+~
+#IS_ZERO
+[n:n([y:FALSE])(TRUE)]
+~
+"""
+
+@contextlib.contextmanager
+def _quiet():
+
+    """Ignores warnings, e.g. unused macros"""
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        yield
+
+def run_backend(backend:str, code:str, stdin:str = "",
+        decode:bool = False) -> Tuple[str, Optional[Exception], float, Optional[int], Optional[int]]:
+
+    """Runs floof program `code` on `backend`
+
+    Parameters
+    ----------
+    backend : str
+        Key of `BACKENDS`
+    code : str
+        Floof program code
+    stdin : str, optional (default "")
+        Input given to the program
+    decode : bool, optional (default False)
+        Decodes the object the program evaluates to as an integer
+
+    Returns
+    -------
+    Tuple[str, Optional[Exception], float, Optional[int], Optional[int]]
+        str: Output of the program
+        Optional[Exception]: Error raised, None if the program ran successfully
+        float: Time taken in seconds, including compilation but not parsing
+        Optional[int]: Number of steps, None if backend does not count steps
+        Optional[int]: Decoded integer, None if not `decode` or decoding failed
+    """
+
+    _atoms._buffer = ""
+    out = io.StringIO()
+    stdin_old = sys.stdin
+    sys.stdin = io.StringIO(stdin)
+    err = None
+    steps = None
+    value = None
+
+    # Parsing is the same for every backend, only time what comes after
+    start = None
+    try:
+        with contextlib.redirect_stdout(out), _quiet():
+            floof = Floof(code)
+            start = time.perf_counter()
+            steps, to_int = BACKENDS[backend](floof)
+    except (FloofParseError, FloofCompileError, FloofSyntaxError, FloofRuntimeError) as e:
+        err = e
+    finally:
+        sys.stdin = stdin_old
+    elapsed = 0.0 if start is None else time.perf_counter() - start
+
+    if decode and err is None:
+        try:
+            with contextlib.redirect_stdout(out):
+                value = to_int()
+        except Exception:
+            pass
+        if type(value) is not int:
+            value = None
+
+    return out.getvalue(), err, elapsed, steps, value
+
+class TermGenerator:
+
+    """
+    Class used to generate random well-scoped Floof programs with known output
+
+    Terms are integer expressions built out of `Node` and `Token`: literals,
+    variables, `INC`, `ADD`, `MUL`, `TRUE`/`FALSE` selection, `_OUT_INT_`,
+    let bindings `[v:body](value)`, two argument functions that are
+    either fully applied or passed around as values, and `ZCOM` loops that
+    call themselves either directly or as a value. Variable names are drawn
+    from small pools so that shadowing is common. Some programs add an
+    expression that raises a runtime error.
+
+    ...
+
+    Methods
+    -------
+    program(self) -> Tuple[str, str, Optional[int]]
+        Generates a program, the output it is expected to print and its value
+    """
+
+    VARS = ['v0', 'v1', 'v2']
+    FUNCS = ['g0', 'g1']
+    MAX_VALUE = 60
+    ERROR_RATE = 0.1
+
+    def __init__(self, seed:int, depth:int = 4):
+
+        """
+        Parameters
+        ----------
+        seed : int
+            Seed of the random generator
+        depth : int, optional (default 4)
+            Maximum depth of generated terms
+        """
+
+        self.rng = random.Random(seed)
+        self.depth = depth
+
+    @staticmethod
+    def _name(name:str) -> Token:
+        return Token(name, -1, True)
+
+    @staticmethod
+    def _call(f:Union[Node, Token], *args:Union[Node, Token]) -> Node:
+        for a in args:
+            f = Node(NodeType.CALL, (f, a))
+        return f
+
+    @staticmethod
+    def _decl(argname:str, defi:Union[Node, Token]) -> Node:
+        return Node(NodeType.DECL, (TermGenerator._name(argname), defi))
+
+    @staticmethod
+    def _numeral(n:int) -> Node:
+        f = TermGenerator._name('f')
+        defi = TermGenerator._name('x')
+        for _ in range(n):
+            defi = TermGenerator._call(f, defi)
+        return TermGenerator._decl('f', TermGenerator._decl('x', defi))
+
+    def _term(self, depth:int, scope:Dict[str, int], funcs:List[str]) -> Tuple[Union[Node, Token], int, List[int]]:
+
+        """Generates an integer expression
+
+        Returns
+        -------
+        Tuple[Union[Node, Token], int, List[int]]
+            Union[Node, Token]: Ast of the expression
+            int: Value of the expression
+            List[int]: Integers printed while evaluating the expression, in order
+        """
+
+        rng = self.rng
+        name, call, decl = self._name, self._call, self._decl
+
+        choices = ['lit'] + (['var'] if scope else [])
+        if depth > 0:
+            choices += ['inc', 'add', 'mul', 'select', 'out', 'let', 'func', 'loop']
+            if funcs:
+                choices += ['apply', 'apply', 'escape']
+        kind = rng.choice(choices)
+
+        if kind == 'lit':
+            n = rng.randint(0, 3)
+            return self._numeral(n), n, []
+
+        if kind == 'var':
+            v = rng.choice(sorted(scope))
+            return name(v), scope[v], []
+
+        if kind == 'inc':
+            a, av, ao = self._term(depth-1, scope, funcs)
+            return call(name('INC'), a), av+1, ao
+
+        if kind == 'out':
+            a, av, ao = self._term(depth-1, scope, funcs)
+            return call(name('_OUT_INT_'), a), av, ao+[av]
+
+        if kind == 'let':
+            v = rng.choice(self.VARS)
+            a, av, ao = self._term(depth-1, scope, funcs)
+            n_scope = dict(scope)
+            n_scope[v] = av
+            b, bv, bo = self._term(depth-1, n_scope, funcs)
+            return call(decl(v, b), a), bv, ao+bo
+
+        if kind == 'func':
+            # Binds a function that adds its two arguments
+            g = rng.choice(self.FUNCS)
+            p, q = rng.sample(['p', 'q', 'r'], 2)
+            defi = decl(p, decl(q, call(name('ADD'), name(p), name(q))))
+            b, bv, bo = self._term(depth-1, scope, sorted(set(funcs+[g])))
+            return call(decl(g, b), defi), bv, bo
+
+        a, av, ao = self._term(depth-1, scope, funcs)
+        b, bv, bo = self._term(depth-1, scope, funcs)
+
+        if kind == 'add':
+            node, value = call(name('ADD'), a, b), av+bv
+        elif kind == 'mul':
+            node, value = call(name('MUL'), a, b), av*bv
+        elif kind == 'select':
+            cond = rng.choice(['TRUE', 'FALSE'])
+            node, value = call(name(cond), a, b), (av if cond == 'TRUE' else bv)
+        elif kind == 'apply':
+            g = rng.choice(funcs)
+            node, value = call(name(g), a, b), av+bv
+        elif kind == 'escape':
+            # Passes the function as a value, so it is called through its curried wrapper
+            g = rng.choice(funcs)
+            node, value = call(decl('h', call(name('h'), a, b)), name(g)), av+bv
+        elif kind == 'loop':
+            # Adds c to b, a times, in a loop written with the Z combinator
+            if av > 10:
+                return self._term(0, scope, funcs)
+            c = rng.randint(0, 3)
+            rec = [call(name('DEC'), name('k')), call(name('ADD'), name('acc'), self._numeral(c))]
+            if rng.random() < 0.5:
+                rec = call(name('lp'), *rec)
+            else:
+                # Passes the loop itself as a value
+                rec = call(decl('h', call(name('h'), *rec)), name('lp'))
+            body = call(name('IS_ZERO'), name('k'), decl('x', name('acc')), decl('x', rec), decl('x', name('x')))
+            loop = call(name('ZCOM'), decl('lp', decl('k', decl('acc', body))))
+            if rng.random() < 0.5:
+                node = call(loop, a, b)
+            else:
+                node = call(decl('lq', call(name('lq'), a, b)), loop)
+            value = bv+av*c
+        else:
+            raise FloofCompileError("Unknown term `%s`"%kind)
+
+        if value > self.MAX_VALUE:
+            return self._term(0, scope, funcs)
+        return node, value, ao+bo
+
+    def _error(self) -> Node:
+
+        """Generates an expression that raises a runtime error"""
+
+        name, call, decl = self._name, self._call, self._decl
+        none = Node(NodeType.NONE, ())
+        return self.rng.choice([
+            call(decl('x', name('x')), none),           # Function called without an argument
+            call(name('_IN_INT_'), self._numeral(0)),   # Input called with an argument
+            call(name('_OUT_INT_'), none)               # Output called without an argument
+        ])
+
+    def program(self) -> Tuple[str, str, Optional[int]]:
+
+        """Generates a program, the output it is expected to print and its value
+
+        Returns
+        -------
+        Tuple[str, str, Optional[int]]
+            str: Floof program code
+            str: Expected output
+            Optional[int]: Integer the program evaluates to, None if it raises a runtime error
+        """
+
+        term, value, out = self._term(self.depth, {}, [])
+
+        if self.rng.random() < self.ERROR_RATE:
+            # Arguments are evaluated left to right, so only what is
+            # printed before the error is expected
+            if self.rng.random() < 0.5:
+                term = self._call(self._name('ADD'), term, self._error())
+            else:
+                term = self._call(self._name('ADD'), self._error(), term)
+                out = []
+            value = None
+
+        main = self._call(self._name('_OUT_INT_'), term)
+        code = PRELUDE + "!\n%s\n~\n"%main.to_str()
+        expected = "".join(str(v) for v in out+([] if value is None else [value]))
+        return code, expected, value
+
+def _programs(seed:int, count:int) -> List[Tuple[str, str, str, Optional[Tuple[str, Optional[int]]]]]:
+
+    """Programs to check, as (name, code, stdin, expected output and value or None)"""
+
+    programs = []
+    for filename in sorted(glob.glob(os.path.join(EXAMPLES_DIR, "*.floof"))):
+        name = os.path.basename(filename)
+        programs.append((name, open(filename).read(), EXAMPLE_INPUTS.get(name, EXAMPLE_INPUT), None))
+
+    generator = TermGenerator(seed)
+    for i in range(count):
+        code, expected, value = generator.program()
+        programs.append(("random-%d-%d"%(seed, i), code, "", (expected, value)))
+
+    return programs
+
+def check_diagnose() -> List[str]:
+
+    """Checks `Floof.diagnose` on `DIAGNOSE_CASES`
+
+    Returns
+    -------
+    List[str]
+        Failures, empty if every case passed
+    """
+
+    failures = []
+    for code, expected in DIAGNOSE_CASES:
+        try:
+            found = [(d.severity, d.msg, d.line, d.col) for d in Floof.diagnose(code)]
+        except Exception as e:
+            failures.append("diagnose %r raised %s: %s"%(code, type(e).__name__, e))
+            continue
+        if found != expected:
+            failures.append("diagnose %r reported %r, expected %r"%(code, found, expected))
+    return failures
+
+def check(seed:int = 0, count:int = 200, repeat:int = 3, baseline:Optional[dict] = None,
+        threshold:float = 0.25) -> Tuple[List[str], dict]:
+
+    """Runs all programs through all backends
+
+    Parameters
+    ----------
+    seed : int, optional (default 0)
+        Seed used to generate random programs
+    count : int, optional (default 200)
+        Number of random programs
+    repeat : int, optional (default 3)
+        Runs per backend on example programs, the fastest is recorded
+    baseline : Optional[dict], optional (default None)
+        Results of an earlier run to check for performance regressions
+    threshold : float, optional (default 0.25)
+        Allowed relative slowdown over `baseline`, and of `FAST_BACKENDS`
+        over `REFERENCE` on examples
+
+    Returns
+    -------
+    Tuple[List[str], dict]
+        List[str]: Failures, empty if every check passed
+        dict: Results, {program: {backend: {"time": float, "steps": int}}}
+    """
+
+    failures = []
+    results = {}
+    random_totals = {b:{"time": 0.0, "steps": None} for b in BACKENDS}
+
+    for name, code, stdin, expected in _programs(seed, count):
+        is_random = expected is not None
+        runs = {}
+        for backend in BACKENDS:
+            best = None
+            for _ in range(1 if is_random else repeat):
+                run = run_backend(backend, code, stdin, decode=True)
+                if best is None or run[2] < best[2]:
+                    best = run
+            runs[backend] = best
+
+        ref_out, ref_err, _, _, ref_value = runs[REFERENCE]
+        if is_random:
+            exp_out, exp_value = expected
+            if exp_value is None:
+                ok = type(ref_err) is FloofRuntimeError and ref_out == exp_out
+            else:
+                ok = ref_err is None and (ref_out, ref_value) == expected
+            if not ok:
+                failures.append("%s: `%s` printed %r and evaluated to %s (error: %s), expected %r and %s"%(
+                    name, REFERENCE, ref_out, ref_value, ref_err, exp_out,
+                    "a runtime error" if exp_value is None else exp_value))
+
+        # Backends word their errors differently, only the type must match
+        for backend, (out, err, _, _, value) in runs.items():
+            if (out, type(err)) != (ref_out, type(ref_err)):
+                failures.append("%s: `%s` printed %r (error: %s), `%s` printed %r (error: %s)"%(
+                    name, backend, out, err, REFERENCE, ref_out, ref_err))
+            elif value != ref_value:
+                failures.append("%s: `%s` evaluated to %s, `%s` evaluated to %s"%(
+                    name, backend, value, REFERENCE, ref_value))
+
+        if is_random:
+            for backend, (_, _, elapsed, steps, _) in runs.items():
+                random_totals[backend]["time"] += elapsed
+                if steps is not None:
+                    random_totals[backend]["steps"] = (random_totals[backend]["steps"] or 0) + steps
+        else:
+            results[name] = {b:{"time": r[2], "steps": r[3]} for b,r in runs.items()}
+
+    # Random programs are so short that their time is mostly compilation,
+    # so only examples are checked against REFERENCE
+    for name, backends in results.items():
+        ref_time = backends[REFERENCE]["time"]
+        for backend in FAST_BACKENDS:
+            t = backends[backend]["time"]
+            if t > ref_time*(1+threshold) and t-ref_time > TIME_RESOLUTION:
+                failures.append("%s: `%s` is slower than `%s`, %.4fs over %.4fs"%(
+                    name, backend, REFERENCE, t, ref_time))
+
+    if count:
+        results["random-%d-x%d"%(seed, count)] = random_totals
+
+    if baseline:
+        for name, backends in results.items():
+            for backend, r in backends.items():
+                base = baseline.get(name, {}).get(backend)
+                if not base:
+                    continue
+                for key, resolution in (("time", TIME_RESOLUTION), ("steps", 0)):
+                    if not base.get(key) or r[key] is None:
+                        continue
+                    if r[key] > base[key]*(1+threshold) and r[key]-base[key] > resolution:
+                        failures.append("%s: `%s` %s regressed from %s to %s"%(
+                            name, backend, key, base[key], r[key]))
+
+    return failures, results
+
+def main():
+
+    parser = argparse.ArgumentParser(prog="python -m floof._harness")
+    parser.add_argument("--seed", type=int, default=0, help="seed for random programs (default 0)")
+    parser.add_argument("--count", type=int, default=200, help="number of random programs (default 200)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per example, fastest is kept (default 3)")
+    parser.add_argument("--baseline", type=str, help="fail on regressions over this results file")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown over baseline (default 0.25)")
+    parser.add_argument("--save-baseline", type=str, help="write results to this file")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    failures, results = check(args.seed, args.count, args.repeat, baseline, args.threshold)
+    failures += check_diagnose()
+
+    for name, backends in results.items():
+        for backend, r in backends.items():
+            steps = "" if r["steps"] is None else "%d steps"%r["steps"]
+            print("%-24s %-12s %9.4fs %s"%(name, backend, r["time"], steps))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+
+    for failure in failures:
+        print("FAIL", failure)
+
+    if failures:
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,603 @@
+import json
+import os
+from typing import List, Tuple, Union, Optional, NoReturn
+
+from ._exceptions import *
+from ._floof import Node, NodeType, Token
+
+SNAPSHOT_VERSION = 1
+
+# Runtime objects are plain (nested) tuples so that the whole machine state
+# can be flattened into a table and written to disk:
+#
+#   Values
+#       ('clo', lam_idx, env)   Closure of the `lam` instruction at lam_idx
+#       ('atom', name)          One of the reserved functions (`_OUT_INT_`...)
+#       ('num', n)              Integer `n` read from input
+#       ('numf', n, f)          Integer `n` partially applied to `f`
+#       ('succ',)               Successor used to decode integers for output
+#       int                     Decoded integer
+#       ('bool', b)             TRUE or FALSE, used in binary numerals
+#       ('boolf', b, x)         TRUE or FALSE partially applied to `x`
+#       ('pair', x, y)          PAIR(x)(y), used in binary numerals
+#       bool                    Decoded boolean
+#
+#   Environments
+#       None | (name, value, parent_env)
+#
+#   Control
+#       ('eval', idx, env)      Evaluate instruction idx in env
+#       ('apply', f, x)         Apply value f to value x (x is None if no argument)
+#       ('ret', value)          Return value to the top continuation frame
+#
+#   Continuation frames
+#       ('arg', idx, env)       Evaluate argument idx, then call the returned function
+#       ('call', f)             Call f with the returned value
+#       ('apply_to', x)         Call the returned value with x
+#       ('iter', f, k)          Apply f to the returned value k more times
+#       ('out', name, arg)      Print the returned integer, then return arg
+#       ('outbin', arg, node, n, bit, phase)
+#                               Decode the binary numeral arg one bit at a time,
+#                               see `_return`
+
+_ATOMS = ('_OUT_CHAR_', '_IN_CHAR_', '_OUT_INT_', '_IN_INT_', '_OUT_BIN_', '_IN_BIN_')
+_SUCC = ('succ',)
+_TRUE = ('bool', True)
+_FALSE = ('bool', False)
+_BIN_EMPTY = ('pair', _TRUE, _TRUE)
+
+class FloofMachine:
+
+    """
+    Class used to evaluate a Floof program with explicit state
+
+    The program is evaluated one step at a time, with the environment,
+    continuation and pending input buffer held as plain data instead of
+    Python closures. The state can be saved to disk in between steps and
+    resumed later, possibly on another host.
+
+    ...
+
+    Attributes
+    ----------
+    steps : int
+        Number of steps executed so far
+    halted : bool
+        True once the program has finished evaluating
+
+    _code : List[tuple]
+        Flattened instructions of the program
+    _control : tuple
+        What the machine does on the next step
+    _cont : List[tuple]
+        Continuation frames, the top frame being the last element
+    _buffer : str
+        Characters read but not yet consumed by `_IN_CHAR_`
+    _interrupted : bool
+        Set by `interrupt`, makes `run` return before the next step
+
+    Methods
+    -------
+    step(self) -> bool
+        Executes a single step
+    run(self, max_steps:int = None) -> bool
+        Runs until the program halts or `max_steps` steps are executed
+    interrupt(self) -> NoReturn
+        Makes `run` return in between steps
+    to_int(self) -> int
+        Decodes the object the program evaluated to as an integer
+    snapshot(self) -> dict
+        Returns the machine state as JSON serialisable data
+    from_snapshot(cls, snapshot:dict) -> `FloofMachine`
+        Initialises FloofMachine from a snapshot
+    save(self, filename:str) -> NoReturn
+        Writes the snapshot to `filename`
+    load(cls, filename:str) -> `FloofMachine`
+        Initialises FloofMachine from a snapshot file
+    """
+
+    def __init__(self, ast:Union[Node, Token], _from_snapshot=False) -> NoReturn:
+
+        """
+        Parameters
+        ----------
+        ast : Union[Node, Token]
+            AST of the whole program, e.g. `FloofBlock.get_ast()`
+        """
+
+        self._interrupted = False
+        if _from_snapshot:
+            return
+
+        self._code = []
+        root = self._compile(ast, self._code)
+
+        self._control = ('eval', root, None)
+        self._cont = []
+        self._buffer = ""
+        self.steps = 0
+        self.halted = False
+
+    @staticmethod
+    def _compile(ast:Union[Node, Token], code:List[tuple]) -> int:
+
+        """Flattens ast into instructions
+
+        Parameters
+        ----------
+        ast : Union[Node, Token]
+            Ast to flatten
+        code : List[tuple]
+            Instructions, appended to in place
+
+        Returns
+        -------
+        int
+            Index into `code` of the instruction for `ast`
+        """
+
+        if type(ast) is Token:
+            code.append(('var', str(ast)))
+            return len(code)-1
+
+        if ast.type == NodeType.NONE:
+            code.append(('none',))
+
+        elif ast.type == NodeType.DECL:
+            argname, defi = ast.childs
+            body = FloofMachine._compile(defi, code)
+            code.append(('lam', str(argname), body))
+
+        elif ast.type == NodeType.CALL:
+            A,B = ast.childs
+            f = FloofMachine._compile(A, code)
+            a = FloofMachine._compile(B, code)
+            code.append(('app', f, a))
+
+        else:
+            raise FloofCompileError("Unknown NodeType!")
+
+        return len(code)-1
+
+    @staticmethod
+    def _lookup(name:str, env:Optional[tuple]) -> tuple:
+
+        """Looks up `name` in `env`, falling back to the reserved functions"""
+
+        while env is not None:
+            if env[0] == name:
+                return env[1]
+            env = env[2]
+
+        if name not in _ATOMS:
+            raise FloofRuntimeError("Name `%s` is not defined!"%name)
+        return ('atom', name)
+
+    def _read_int(self) -> int:
+
+        try:
+            n = int(input())
+        except ValueError as e:
+            raise FloofRuntimeError(e.args[0]) from e
+        if n < 0:
+            raise FloofRuntimeError("Input `%d` is not a non-negative integer"%n)
+        return n
+
+    def _read_char(self) -> int:
+
+        if not self._buffer:
+            self._buffer = input()+"\n"
+        n = ord(self._buffer[0])
+        self._buffer = self._buffer[1:]
+        return n
+
+    @staticmethod
+    def _in_bin(n:int) -> tuple:
+        arr = _BIN_EMPTY
+        for bit in bin(n)[2:]:
+            arr = ('pair', _FALSE, ('pair', _TRUE if bit == '1' else _FALSE, arr))
+        return arr
+
+    def _test(self, boolean:tuple, selector:tuple) -> tuple:
+
+        """Returns control that computes boolean(selector)(True)(False)"""
+
+        self._cont.append(('apply_to', False))
+        self._cont.append(('apply_to', True))
+        return ('apply', boolean, selector)
+
+    def _apply_atom(self, name:str, x:Optional[tuple]) -> tuple:
+
+        """Returns next control after calling reserved function `name` with `x`"""
+
+        if name in ('_IN_INT_', '_IN_CHAR_', '_IN_BIN_'):
+            if x is not None:
+                raise FloofRuntimeError("`%s` takes no arguments"%name)
+            if name == '_IN_BIN_':
+                return ('ret', self._in_bin(self._read_int()))
+            n = self._read_int() if name == '_IN_INT_' else self._read_char()
+            return ('ret', ('num', n))
+
+        if x is None:
+            raise FloofRuntimeError("`%s` missing argument"%name)
+
+        if name == '_OUT_BIN_':
+            self._cont.append(('outbin', x, x, 0, 1, 'end'))
+            return self._test(x, _TRUE)
+
+        # Decode integer as x(succ)(0), then print it
+        self._cont.append(('out', name, x))
+        self._cont.append(('apply_to', 0))
+        return ('apply', x, _SUCC)
+
+    def _apply(self, f:tuple, x:Optional[tuple]) -> tuple:
+
+        """Returns next control after calling `f` with `x`"""
+
+        if type(f) in (int, bool):
+            raise FloofRuntimeError("Decoded object `%s` is not a function"%f)
+
+        ftype = f[0]
+        if ftype == 'clo':
+            _, argname, body = self._code[f[1]]
+            if x is None:
+                raise FloofRuntimeError("Function `[%s:...]` missing argument"%argname)
+            return ('eval', body, (argname, x, f[2]))
+
+        if x is None and ftype != 'atom':
+            raise FloofRuntimeError("Function missing argument")
+
+        if ftype == 'atom':
+            return self._apply_atom(f[1], x)
+
+        elif ftype == 'num':
+            return ('ret', ('numf', f[1], x))
+
+        elif ftype == 'numf':
+            n, g = f[1], f[2]
+            if n == 0:
+                return ('ret', x)
+            self._cont.append(('iter', g, n-1))
+            return ('apply', g, x)
+
+        elif ftype == 'bool':
+            return ('ret', ('boolf', f[1], x))
+
+        elif ftype == 'boolf':
+            return ('ret', f[2] if f[1] else x)
+
+        elif ftype == 'pair':
+            self._cont.append(('apply_to', f[2]))
+            return ('apply', x, f[1])
+
+        elif ftype == 'succ':
+            if type(x) is not int:
+                raise FloofRuntimeError("Object is not an integer")
+            return ('ret', x+1)
+
+        raise FloofRuntimeError("Unknown object `%s`"%ftype)
+
+    def _return(self, value:tuple) -> Optional[tuple]:
+
+        """Returns next control after returning `value`, None if program halts"""
+
+        if not self._cont:
+            return None
+
+        frame = self._cont.pop()
+        ftype = frame[0]
+
+        if ftype == 'arg':
+            _, idx, env = frame
+            if self._code[idx][0] == 'none':
+                return ('apply', value, None)
+            self._cont.append(('call', value))
+            return ('eval', idx, env)
+
+        elif ftype == 'call':
+            return ('apply', frame[1], value)
+
+        elif ftype == 'apply_to':
+            return ('apply', value, frame[1])
+
+        elif ftype == 'iter':
+            _, g, k = frame
+            if k == 0:
+                return ('ret', value)
+            self._cont.append(('iter', g, k-1))
+            return ('apply', g, value)
+
+        elif ftype == 'out':
+            _, name, arg = frame
+            if type(value) is not int:
+                raise FloofRuntimeError("`%s` called with an object that is not an integer"%name)
+            print(value if name == '_OUT_INT_' else chr(value), end="")
+            return ('ret', arg)
+
+        elif ftype == 'outbin':
+            # 'end':  value is True if node is the end of the array
+            # 'cell': value is node(FALSE), i.e. (ELEMENT, NEXT)
+            # 'bit':  value is True if ELEMENT of node is 1
+            # 'next': value is NEXT
+            _, arg, node, n, bit, phase = frame
+            if phase in ('end', 'bit') and type(value) is not bool:
+                raise FloofRuntimeError("`_OUT_BIN_` called with an object that is not a binary numeral")
+
+            if phase == 'end':
+                if value:
+                    print(n, end="")
+                    return ('ret', arg)
+                self._cont.append(('outbin', arg, node, n, bit, 'cell'))
+                return ('apply', node, _FALSE)
+
+            elif phase == 'cell':
+                self._cont.append(('outbin', arg, value, n, bit, 'bit'))
+                return self._test(value, _TRUE)
+
+            elif phase == 'bit':
+                if value:
+                    n |= bit
+                self._cont.append(('outbin', arg, node, n, bit, 'next'))
+                return ('apply', node, _FALSE)
+
+            elif phase == 'next':
+                self._cont.append(('outbin', arg, value, n, bit << 1, 'end'))
+                return self._test(value, _TRUE)
+
+        raise FloofRuntimeError("Unknown continuation frame `%s`"%ftype)
+
+    def step(self) -> bool:
+
+        """Executes a single step
+
+        Returns
+        -------
+        bool
+            True if the program has halted
+        """
+
+        if self.halted:
+            return True
+
+        control = self._control
+        ctype = control[0]
+
+        if ctype == 'eval':
+            _, idx, env = control
+            ins = self._code[idx]
+            itype = ins[0]
+            if itype == 'var':
+                control = ('ret', self._lookup(ins[1], env))
+            elif itype == 'lam':
+                control = ('ret', ('clo', idx, env))
+            elif itype == 'app':
+                self._cont.append(('arg', ins[2], env))
+                control = ('eval', ins[1], env)
+            else:
+                raise FloofRuntimeError("Cannot evaluate an empty expression")
+
+        elif ctype == 'apply':
+            control = self._apply(control[1], control[2])
+
+        elif ctype == 'ret':
+            nxt = self._return(control[1])
+            if nxt is None:
+                self.halted = True
+            else:
+                control = nxt
+
+        self._control = control
+        self.steps += 1
+        return self.halted
+
+    def run(self, max_steps:int = None) -> bool:
+
+        """Runs until the program halts, `max_steps` steps are executed
+        or `interrupt` is called
+
+        Parameters
+        ----------
+        max_steps : int, optional (default None)
+            Maximum number of steps to execute. Runs to completion if None
+
+        Returns
+        -------
+        bool
+            True if the program has halted
+        """
+
+        step = self.step
+        try:
+            if max_steps is None:
+                while not step() and not self._interrupted: pass
+            else:
+                for _ in range(max_steps):
+                    if step() or self._interrupted: break
+        except FloofRuntimeError:
+            raise
+        except Exception as e:
+            raise FloofRuntimeError(str(e)) from e
+        finally:
+            self._interrupted = False
+
+        return self.halted
+
+    def interrupt(self) -> NoReturn:
+
+        """Makes `run` return in between steps
+
+        A step changes both the control and the continuation, so the state
+        is only consistent in between steps. Signal handlers should call
+        this instead of raising, and save the snapshot once `run` returns.
+        """
+
+        self._interrupted = True
+
+    def to_int(self) -> int:
+
+        """Decodes the object the program evaluated to as an integer
+
+        Evaluates `value(succ)(0)` on a separate machine, so the state of
+        this one is left untouched.
+
+        Returns
+        -------
+        int
+            Integer represented by the object
+        """
+
+        if not self.halted:
+            raise FloofRuntimeError("Program has not halted")
+
+        machine = FloofMachine(None, _from_snapshot=True)
+        machine._code = self._code
+        machine._control = ('apply', self._control[1], _SUCC)
+        machine._cont = [('apply_to', 0)]
+        machine._buffer = self._buffer
+        machine.steps = 0
+        machine.halted = False
+        machine.run()
+
+        n = machine._control[1]
+        if type(n) is not int:
+            raise FloofRuntimeError("Object is not an integer")
+        return n
+
+    @staticmethod
+    def _flatten(root:tuple) -> Tuple[List[list], int]:
+
+        """Flattens nested tuples into a table, preserving sharing
+
+        Every tuple becomes one table entry, children first. A reference to
+        another entry is written as a single element list `[index]`.
+        """
+
+        table = []
+        index = {}
+        stack = [(root, False)]
+
+        while stack:
+            obj, expanded = stack.pop()
+            if id(obj) in index:
+                continue
+            if expanded:
+                index[id(obj)] = len(table)
+                table.append([[index[id(o)]] if type(o) is tuple else o for o in obj])
+                continue
+            stack.append((obj, True))
+            for o in obj:
+                if type(o) is tuple and id(o) not in index:
+                    stack.append((o, False))
+
+        return table, index[id(root)]
+
+    @staticmethod
+    def _unflatten(table:List[list], root:int) -> tuple:
+
+        """Inverse of `_flatten`"""
+
+        objs = []
+        for entry in table:
+            objs.append(tuple(objs[o[0]] if type(o) is list else o for o in entry))
+        return objs[root]
+
+    def snapshot(self) -> dict:
+
+        """Returns the machine state as JSON serialisable data
+
+        Returns
+        -------
+        dict
+            Program, environment, continuation and pending input buffer
+        """
+
+        state = (self._control, tuple(self._cont))
+        table, root = self._flatten(state)
+        return {
+            "version": SNAPSHOT_VERSION,
+            "code": [list(ins) for ins in self._code],
+            "objects": table,
+            "state": root,
+            "buffer": self._buffer,
+            "steps": self.steps,
+            "halted": self.halted
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot:dict) -> 'FloofMachine':
+
+        """Initialises FloofMachine from a snapshot
+
+        Parameters
+        ----------
+        snapshot : dict
+            Data returned by `snapshot`
+
+        Returns
+        -------
+        FloofMachine
+            Machine that resumes where the snapshot was taken
+        """
+
+        if type(snapshot) is not dict:
+            raise FloofRuntimeError("Snapshot is not a JSON object")
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            raise FloofRuntimeError("Unsupported snapshot version `%s`"%snapshot.get("version"))
+
+        machine = cls(None, _from_snapshot=True)
+        try:
+            machine._code = [tuple(ins) for ins in snapshot["code"]]
+            control, cont = cls._unflatten(snapshot["objects"], snapshot["state"])
+            machine._control = control
+            machine._cont = list(cont)
+            machine._buffer = snapshot["buffer"]
+            machine.steps = snapshot["steps"]
+            machine.halted = snapshot["halted"]
+        except KeyError as e:
+            raise FloofRuntimeError("Snapshot is missing `%s`"%e.args[0]) from e
+        except (IndexError, TypeError, ValueError) as e:
+            raise FloofRuntimeError("Malformed snapshot: %s"%e) from e
+        return machine
+
+    def save(self, filename:str) -> NoReturn:
+
+        """Writes the snapshot to `filename`
+
+        The file is replaced atomically so an interrupted save never
+        clobbers the previous snapshot.
+
+        Parameters
+        ----------
+        filename : str
+            File to write to
+        """
+
+        tmp = filename + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f, separators=(',', ':'))
+        os.replace(tmp, filename)
+
+    @classmethod
+    def load(cls, filename:str) -> 'FloofMachine':
+
+        """Initialises FloofMachine from a snapshot file
+
+        Parameters
+        ----------
+        filename : str
+            File written by `save`
+
+        Returns
+        -------
+        FloofMachine
+            Machine that resumes where the snapshot was taken
+        """
+
+        try:
+            with open(filename) as f:
+                snapshot = json.load(f)
+        except OSError as e:
+            raise FloofRuntimeError("Cannot read snapshot `%s`: %s"%(filename, e.strerror)) from e
+        except ValueError as e:
+            raise FloofRuntimeError("Snapshot `%s` is not valid JSON: %s"%(filename, e)) from e
+        return cls.from_snapshot(snapshot)